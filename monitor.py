@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import functools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import oci
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+CONFIG_FILE = "oci_monitor_config.json"
+
+# 复用同一个Session: 对检测服务保持长连接，省掉每次轮询的TCP/TLS握手
+_SESSION = requests.Session()
+_SESSION.headers["Connection"] = "keep-alive"
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+)
+_SESSION.mount("http://", _adapter)
+_SESSION.mount("https://", _adapter)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler("oci_monitor.log", encoding="utf-8"),
+    ],
+)
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_config(config_file, mtime_ns):
+    """按mtime缓存解析结果，文件没变时不重复读盘/解析"""
+    with open(config_file, 'r') as f:
+        return json.load(f)
+
+
+def load_config(config_file=CONFIG_FILE):
+    """加载配置文件"""
+    if not os.path.exists(config_file):
+        logger.error("配置文件 %s 不存在，请先运行 oracle.py 生成配置", config_file)
+        sys.exit(1)
+
+    return _parse_config(config_file, os.stat(config_file).st_mtime_ns)
+
+
+class CheckConnection:
+    """通过远程检测服务检查服务器端口的连通性"""
+
+    _BOOL_RESPONSES = {b"True": True, b"False": False}
+
+    @staticmethod
+    def remote_check(ip, port, check_url):
+        """请求远程检测服务，返回目标端口是否可达"""
+        params = {"ip": ip, "port": port}
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("发送远程检测请求: %s 参数: %s", check_url, params)
+            response = _SESSION.get(check_url, params=params, timeout=(3, 7))
+            # 用content直接做字节比较，跳过response.text的编码探测
+            raw = response.content[:8].strip()
+            result = CheckConnection._BOOL_RESPONSES.get(raw)
+            if result is None:
+                logger.warning("远程检测服务返回异常内容: %r", raw)
+                return False
+            return result
+        except Exception as e:
+            logger.error("远程检测请求失败: %s", e)
+            return False
+
+
+class _TTLCache:
+    """带TTL的结果缓存，并发请求同一key时只发起一次调用，其余等待结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (过期时间, 值) 或 (None, 进行中的Event)
+
+    def get_or_call(self, key, fn, ttl):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                waiter = None
+                if entry is not None:
+                    expiry, value = entry
+                    if expiry is None:
+                        waiter = value
+                    elif time.monotonic() < expiry:
+                        return value
+                if waiter is None:
+                    # 顺手清掉过期条目，IP轮换产生的旧key不会无限堆积
+                    now = time.monotonic()
+                    for stale in [k for k, (exp, _) in self._entries.items()
+                                  if exp is not None and exp <= now]:
+                        del self._entries[stale]
+                    event = threading.Event()
+                    self._entries[key] = (None, event)
+                    break
+            waiter.wait()
+        try:
+            value = fn()
+        except BaseException:
+            with self._lock:
+                del self._entries[key]
+            event.set()
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+        event.set()
+        return value
+
+
+# 同一个 (ip, port) 在一轮内的重复检查共用一次HTTP请求
+_CHECK_CACHE = _TTLCache()
+
+
+# 按 (配置文件路径, profile) 共享的OCI客户端，指向同一profile的账户复用同一份连接池
+_OCI_CLIENTS = {}
+
+
+def init_oci_clients(account, proxy=""):
+    """初始化账户的OCI客户端，相同profile的账户共享客户端"""
+    config_path = os.path.expanduser(account["oci_config_path"])
+    profile = account.get("oci_profile", "DEFAULT")
+    key = (config_path, profile)
+    if key in _OCI_CLIENTS:
+        return _OCI_CLIENTS[key]
+
+    oci_config = oci.config.from_file(config_path, profile)
+    compute_client = oci.core.ComputeClient(
+        oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+    network_client = oci.core.VirtualNetworkClient(
+        oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+    # 挂上带连接池的adapter，多线程并发调用时复用HTTPS连接
+    for client in (compute_client, network_client):
+        client.base_client.session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=8, pool_maxsize=64, pool_block=False),
+        )
+        if proxy:
+            client.base_client.session.proxies = {"http": proxy, "https": proxy}
+    _OCI_CLIENTS[key] = (compute_client, network_client)
+    return compute_client, network_client
+
+
+class _IPHistoryWriter(threading.Thread):
+    """IP历史的后台落盘线程: 热路径只入队，写盘定期合并成批量write"""
+
+    def __init__(self, interval=5.0):
+        super().__init__(name="ip-history-writer", daemon=True)
+        self._queue = queue.Queue()
+        self._interval = interval
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    def put(self, fd, ip):
+        # 用标志位而非is_alive()做惰性启动，线程只会start一次
+        with self._start_lock:
+            if not self._started:
+                self._started = True
+                self.start()
+        self._queue.put((fd, ip))
+
+    def run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("IP历史落盘失败: %s", e)
+
+    def flush(self):
+        """把队列里攒下的行按fd分组，每个文件一次write写完"""
+        pending = {}
+        while True:
+            try:
+                fd, ip = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.setdefault(fd, []).append(ip)
+        for fd, ips in pending.items():
+            try:
+                os.write(fd, "".join(ip + "\n" for ip in ips).encode())
+            except OSError as e:
+                # 单个fd写失败(磁盘满/已被关闭)不影响其他文件落盘
+                logger.error("IP历史写入失败(fd=%d): %s", fd, e)
+
+
+_IP_WRITER = _IPHistoryWriter()
+
+
+class OCIAPI:
+    """封装针对单个实例的OCI操作"""
+
+    def __init__(self, account_name, compute_client, network_client, server):
+        self.account_name = account_name
+        self.compute_client = compute_client
+        self.network_client = network_client
+        self.compartment_id = server["compartment_id"]
+        self.instance_id = server["instance_id"]
+        self.port = server.get("port", 443)
+        self.vnic_id = server.get("vnic_id") or self._get_primary_vnic_id()
+        # 日志前缀只算一次，省去每条日志的重复拼接
+        self.short_id = self.instance_id[-8:]
+        self.log_prefix = f"账户 {account_name} 实例 {self.short_id}"
+        self.ip_history_file = f"ip_history_{self.short_id}.txt"
+        self._ip_set = set()
+        self._ip_mtime_ns = None
+        self.read_ip()
+        # 常驻的追加fd，每次记录只付一次write的开销
+        self._ip_fd = os.open(
+            self.ip_history_file,
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC,
+            0o644,
+        )
+        self._vnic_cache = None  # (time.monotonic()时间戳, vnic对象)
+
+    def _get_primary_vnic_id(self):
+        """获取实例的主VNIC ID"""
+        # 流式翻页，找到第一个ATTACHED就停，不把整个列表拉下来
+        for attachment in oci.pagination.list_call_get_all_results_generator(
+            self.compute_client.list_vnic_attachments, "record",
+            compartment_id=self.compartment_id, instance_id=self.instance_id,
+        ):
+            if attachment.lifecycle_state == "ATTACHED":
+                return attachment.vnic_id
+        raise RuntimeError(f"实例 {self.instance_id} 没有处于ATTACHED状态的VNIC")
+
+    def _get_vnic(self, ttl=30):
+        """获取VNIC对象，短TTL缓存以避免每轮都向OCI发请求"""
+        now = time.monotonic()
+        if self._vnic_cache and now - self._vnic_cache[0] < ttl:
+            return self._vnic_cache[1]
+        vnic = self.network_client.get_vnic(self.vnic_id).data
+        self._vnic_cache = (now, vnic)
+        return vnic
+
+    def _invalidate_vnic(self):
+        """使VNIC缓存失效(IP变更后调用)"""
+        self._vnic_cache = None
+
+    def get_ip(self):
+        """获取实例当前的公网IP"""
+        return self._get_vnic().public_ip
+
+    def read_ip(self):
+        """读取已使用过的IP历史，文件mtime没变时直接返回缓存的集合"""
+        try:
+            mtime_ns = os.stat(self.ip_history_file).st_mtime_ns
+        except FileNotFoundError:
+            return self._ip_set
+        if mtime_ns != self._ip_mtime_ns:
+            with open(self.ip_history_file, 'r') as f:
+                self._ip_set = set(f.read().split())
+            self._ip_mtime_ns = mtime_ns
+        return self._ip_set
+
+    def record_ip(self, ip):
+        """记录新分配的IP到历史文件"""
+        if ip and ip not in self.read_ip():
+            self._ip_set.add(ip)
+            # 异步落盘；内存集合先行生效，去重不受写盘延迟影响
+            _IP_WRITER.put(self._ip_fd, ip)
+
+    def __del__(self):
+        fd = getattr(self, '_ip_fd', None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _lookup_public_ip_id(self, private_ip_id):
+        """解析私有IP当前绑定的公网IP OCID，未绑定时返回None
+
+        临时公网IP按可用域scope，区域级的list_public_ips查不到，
+        所以直接用get_public_ip_by_private_ip_id反查。
+        """
+        try:
+            return self.network_client.get_public_ip_by_private_ip_id(
+                oci.core.models.GetPublicIpByPrivateIpIdDetails(
+                    private_ip_id=private_ip_id)
+            ).data.id
+        except oci.exceptions.ServiceError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def delete_public_ip(self, public_ip_id):
+        """删除公网IP"""
+        self.network_client.delete_public_ip(public_ip_id)
+
+    def change_ip(self):
+        """删除当前公网IP并申请新的临时公网IP"""
+        old_ip = self._get_vnic().public_ip
+        logger.info("%s 当前IP: %s，开始更换", self.log_prefix, old_ip)
+
+        private_ips = self.network_client.list_private_ips(vnic_id=self.vnic_id).data
+        if not private_ips:
+            raise RuntimeError(f"VNIC {self.vnic_id} 没有私有IP，无法申请公网IP")
+        private_ip_id = private_ips[0].id
+
+        if old_ip:
+            public_ip_id = self._lookup_public_ip_id(private_ip_id)
+            if public_ip_id:
+                self.delete_public_ip(public_ip_id)
+                logger.info("%s 已删除旧IP: %s", self.log_prefix, old_ip)
+                # 等待旧IP真正释放，而不是固定睡10秒
+                try:
+                    oci.wait_until(
+                        self.network_client,
+                        self.network_client.get_public_ip(public_ip_id),
+                        'lifecycle_state', 'TERMINATED',
+                        max_wait_seconds=30, succeed_on_not_found=True,
+                    )
+                except oci.exceptions.ServiceError as e:
+                    if e.status != 404:  # 已经查不到说明删除完成
+                        raise
+            else:
+                logger.warning("IP %s 没有对应的公网IP资源，跳过删除", old_ip)
+
+        public_ip = self.network_client.create_public_ip(
+            oci.core.models.CreatePublicIpDetails(
+                compartment_id=self.compartment_id,
+                lifetime="EPHEMERAL",
+                private_ip_id=private_ip_id,
+            )
+        ).data
+        # 轮询到新IP完成绑定即返回，常见情况下几秒内完成
+        # (绑定到私有IP的公网IP终态是ASSIGNED，AVAILABLE只属于未绑定的保留IP)
+        assigned = oci.wait_until(
+            self.network_client,
+            self.network_client.get_public_ip(public_ip.id),
+            'lifecycle_state', 'ASSIGNED',
+            max_interval_seconds=1, max_wait_seconds=30,
+        ).data
+
+        self._invalidate_vnic()
+        # 新IP直接取自waiter返回的资源，拿不到时才回退查VNIC
+        new_ip = assigned.ip_address or self._get_vnic().public_ip
+        logger.info("%s 新IP: %s", self.log_prefix, new_ip)
+        self.record_ip(new_ip)
+        return new_ip
+
+
+def _check_server(oci_api, check_url, not_before=None, ttl=300.0):
+    """单个实例的一轮检查: 取当前IP并远程检测，返回 (ip, 是否可达)
+
+    not_before是基于time.monotonic()的绝对时刻，用于在轮次内错开各实例
+    的相位；任务在worker上起跑晚于该时刻时直接执行，相位不会层层叠加。
+    检测结果按 (ip, port) 缓存ttl秒，多个实例共用同一前置IP时合并请求。
+    """
+    if not_before is not None:
+        remaining = not_before - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    ip = oci_api.get_ip()
+    if not ip:
+        return None, False
+    reachable = _CHECK_CACHE.get_or_call(
+        (ip, oci_api.port),
+        lambda: CheckConnection.remote_check(ip, oci_api.port, check_url),
+        ttl,
+    )
+    return ip, reachable
+
+
+def _retry_with_backoff(func):
+    """轮次失败时记录日志并指数退避，成功后清零"""
+    failures = 0
+
+    @functools.wraps(func)
+    def wrapper(*args, round_time=600, **kwargs):
+        nonlocal failures
+        try:
+            result = func(*args, round_time=round_time, **kwargs)
+            failures = 0
+            return result
+        except Exception as e:
+            failures += 1
+            delay = min(round_time, 2 ** failures)
+            logger.error("监控轮次执行出错: %s，%d秒后继续", e, delay)
+            time.sleep(delay)
+
+    return wrapper
+
+
+@_retry_with_backoff
+def _one_round(executor, servers, check_url, round_time=600):
+    """执行一轮检查: 并发提交全部实例，失败的串行更换IP"""
+    # 按固定相位把各实例的检查摊开在轮次的前一小段时间里
+    spread = min(30.0, round_time / 2)
+    round_start = time.monotonic()
+    futures = {
+        executor.submit(_check_server, oci_api, check_url,
+                        not_before=round_start + index * spread / len(servers),
+                        ttl=round_time / 2): oci_api
+        for index, oci_api in enumerate(servers)
+    }
+
+    for future in as_completed(futures, timeout=round_time * 0.9):
+        oci_api = futures[future]
+        try:
+            ip, reachable = future.result()
+        except Exception as e:
+            logger.error("%s 检查失败: %s", oci_api.log_prefix, e)
+            continue
+        if not ip:
+            logger.warning("%s 没有公网IP，尝试申请", oci_api.log_prefix)
+            try:
+                oci_api.change_ip()
+            except Exception as e:
+                logger.error("%s 申请IP失败: %s", oci_api.log_prefix, e)
+            continue
+        if reachable:
+            logger.info("%s (%s:%s) 连接正常", oci_api.log_prefix, ip, oci_api.port)
+            continue
+        logger.warning("%s (%s:%s) 连接失败，开始更换IP", oci_api.log_prefix, ip, oci_api.port)
+        try:
+            oci_api.change_ip()
+        except Exception as e:
+            logger.error("%s 更换IP失败: %s", oci_api.log_prefix, e)
+
+
+def run_monitor(servers, global_config):
+    """调度循环: 每轮把所有检查提交到线程池并发执行，失败的实例串行更换IP"""
+    check_url = global_config.get("check_server_url")
+    # 配置里round_time可能是未填的占位字符串，先统一成数字再参与运算
+    round_time = global_config.get("round_time", 600)
+    try:
+        round_time = float(round_time)
+    except (TypeError, ValueError):
+        logger.warning("round_time配置无效: %r，使用默认600秒", round_time)
+        round_time = 600.0
+    # 所有检查都打到同一个检测服务，并发上限同时起到单域名限流的作用
+    max_workers = max(1, min(8, 4 * len(servers)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            round_start = time.time()
+            _one_round(executor, servers, check_url, round_time=round_time)
+            elapsed = time.time() - round_start
+            time.sleep(max(0, round_time - elapsed))
+
+
+if __name__ == "__main__":
+    config = load_config()
+    global_config = config.get("global", {})
+
+    # 代理只挂在各自的Session上，不污染进程环境变量
+    proxy = global_config.get("proxy", "")
+    if proxy:
+        _SESSION.proxies = {"http": proxy, "https": proxy}
+
+    servers = []
+    for account in config.get("accounts", []):
+        account_name = account.get("name", "unknown")
+        try:
+            compute_client, network_client = init_oci_clients(account, proxy)
+        except Exception as e:
+            logger.error("账户 %s 初始化OCI客户端失败: %s", account_name, e)
+            continue
+        for server in account.get("servers", []):
+            try:
+                servers.append(OCIAPI(account_name, compute_client, network_client, server))
+            except Exception as e:
+                logger.error("账户 %s 实例 %s 初始化失败: %s", account_name, server.get('instance_id', '')[-8:], e)
+
+    if not servers:
+        logger.error("没有可监控的实例，退出")
+        sys.exit(1)
+
+    logger.info("开始监控 %d 个实例", len(servers))
+    run_monitor(servers, global_config)
@@ -4,6 +4,13 @@ import json
 import os
 import sys
 
+def _try_int(s, default):
+    """尝试把输入解析为整数，失败时返回默认值"""
+    try:
+        return int(s)
+    except (TypeError, ValueError):
+        return default
+
 def get_user_input(prompt, default=None):
     """获取用户输入，支持默认值"""
     if default:
@@ -31,7 +38,7 @@ def generate_config():
     
     # 检查间隔
     round_time = get_user_input("检查间隔时间(秒)", "600")
-    config["global"]["round_time"] = int(round_time) if round_time.isdigit() else round_time
+    config["global"]["round_time"] = _try_int(round_time, round_time)
     
     # 检测服务URL
     check_url = get_user_input("远程检测服务URL", "http://your-check-server.com/check")
@@ -45,10 +52,8 @@ def generate_config():
         config["global"]["proxy"] = ""
     
     # 账户信息
-    num_accounts = get_user_input("您有几个甲骨文云账户需要监控?", "1")
-    try:
-        num_accounts = int(num_accounts)
-    except ValueError:
+    num_accounts = _try_int(get_user_input("您有几个甲骨文云账户需要监控?", "1"), None)
+    if num_accounts is None:
         print("输入有误，默认使用1个账户")
         num_accounts = 1
     
@@ -71,10 +76,8 @@ def generate_config():
         
         # 服务器信息
         account["servers"] = []
-        num_servers = get_user_input(f"账户{account_idx}中有几个实例需要监控?", "1")
-        try:
-            num_servers = int(num_servers)
-        except ValueError:
+        num_servers = _try_int(get_user_input(f"账户{account_idx}中有几个实例需要监控?", "1"), None)
+        if num_servers is None:
             print("输入有误，默认使用1个实例")
             num_servers = 1
         
@@ -94,7 +97,7 @@ def generate_config():
             
             # 监控端口
             port = get_user_input("需要监控的端口", "443")
-            server["port"] = int(port) if port.isdigit() else port
+            server["port"] = _try_int(port, port)
             
             account["servers"].append(server)
         
@@ -104,8 +107,10 @@ def generate_config():
 
 def save_config(config, filename="oci_monitor_config.json"):
     """保存配置到文件"""
-    with open(filename, 'w') as f:
-        json.dump(config, f, indent=4)
+    # 一次性序列化成bytes再写入，中文不转义成\uXXXX
+    data = json.dumps(config, indent=4, ensure_ascii=False).encode("utf-8")
+    with open(filename, 'wb') as f:
+        f.write(data)
     print(f"\n配置已保存到 {filename}")
     print("如果有任何输入'n'或不确定的部分，请手动编辑文件补充完整。")
 